@@ -1,10 +1,25 @@
 #!/usr/bin/env python3
 import signal
 import os
+import asyncio
 import sys
 import subprocess
+import pty
+import fcntl
+import termios
 import readline
+import re
+import time
+import atexit
+import functools
+import hashlib
+import json
+import mmap
+import tempfile
 from abc import ABC, abstractmethod
+from collections import deque
+from itertools import islice
+from typing import AsyncIterator, Callable, Optional
 
 def exit_handler(sig, frame):
     print()
@@ -15,36 +30,389 @@ signal.signal(signal.SIGINT, exit_handler)
 script_dir = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(script_dir, ".env")
 config_path = os.path.join(script_dir, ".provider")
+semcache_path = os.path.join(script_dir, "semcache.npz")
+history_path = os.path.join(script_dir, "history.jsonl")
+
+# =============================================================================
+# Prompt
+# =============================================================================
+
+# Static instructions sent ahead of every request. Providers cache on exact
+# prefix matches, so nothing per-turn (cwd, history) may be interpolated here,
+# and the examples keep it above the 1024-token minimum for prompt caching.
+STATIC_PROMPT_PREFIX = """You are a shell command translator. Convert the user's request into a shell command for macOS/zsh.
+
+Each request includes the current directory, the recent command history, and the user's request.
+
+Rules:
+- Output ONLY the command, nothing else
+- No explanations, no markdown, no backticks
+- Output a single line; chain steps with && or | instead of newlines
+- If unclear, make a reasonable assumption
+- Prefer simple, common commands
+- Prefer commands that ship with macOS; use GNU-only flags only when the user asks for them
+- Quote paths and arguments that may contain spaces
+- Never add sudo unless the user asks for elevated privileges
+- Use the command history for context (e.g., "do that again", "delete the file I just created")
+- When the request refers to "that", "it", "again" or "the last one", resolve it from the most recent matching history entry
+- Relative paths are relative to the current directory
+
+Examples:
+User request: list all python files
+find . -name "*.py"
+
+User request: show hidden files
+ls -la
+
+User request: how much space is left on my disk
+df -h
+
+User request: show disk usage of this folder
+du -sh .
+
+User request: find the 10 biggest files here
+find . -type f -exec du -h {} + | sort -rh | head -n 10
+
+User request: which folders take the most space
+du -sh * | sort -rh | head -n 10
+
+User request: count lines in all javascript files
+find . -name "*.js" -exec cat {} + | wc -l
+
+User request: search for TODO in python files
+grep -rn "TODO" --include="*.py" .
+
+User request: replace foo with bar in config.txt
+sed -i '' 's/foo/bar/g' config.txt
+
+User request: make a folder called build and go into it
+mkdir -p build && cd build
+
+User request: go up two directories
+cd ../..
+
+User request: go to my downloads
+cd ~/Downloads
+
+User request: create an empty file called notes.md
+touch notes.md
+
+User request: rename old.txt to new.txt
+mv old.txt new.txt
+
+User request: copy the src folder to backup
+cp -R src backup
+
+User request: delete all .DS_Store files
+find . -name ".DS_Store" -delete
+
+User request: remove all __pycache__ folders
+find . -type d -name "__pycache__" -prune -exec rm -rf {} +
+
+User request: make deploy.sh executable
+chmod +x deploy.sh
+
+User request: compress the logs folder
+tar -czf logs.tar.gz logs
+
+User request: extract archive.tar.gz
+tar -xzf archive.tar.gz
+
+User request: unzip photos.zip into photos
+unzip photos.zip -d photos
+
+User request: show the last 50 lines of app.log
+tail -n 50 app.log
+
+User request: follow the server log
+tail -f server.log
+
+User request: what is using port 3000
+lsof -i :3000
+
+User request: kill whatever is on port 8080
+lsof -ti :8080 | xargs kill
+
+User request: show running python processes
+ps aux | grep [p]ython
+
+User request: what is my ip address
+ipconfig getifaddr en0
+
+User request: what is my public ip
+curl -s https://ifconfig.me
+
+User request: download the file at https://example.com/data.csv
+curl -LO https://example.com/data.csv
+
+User request: check if google is reachable
+ping -c 4 google.com
+
+User request: show git status
+git status
+
+User request: commit everything with message fixed bug
+git add -A && git commit -m "fixed bug"
+
+User request: undo the last commit but keep the changes
+git reset --soft HEAD~1
+
+User request: show the last 5 commits
+git log --oneline -n 5
+
+User request: create a branch called feature/login
+git checkout -b feature/login
+
+User request: discard changes to main.py
+git checkout -- main.py
+
+User request: push this branch
+git push -u origin HEAD
+
+User request: what changed in the last commit
+git show --stat HEAD
+
+User request: create a python virtual environment
+python3 -m venv venv
+
+User request: install the requirements
+pip install -r requirements.txt
+
+User request: start a web server here
+python3 -m http.server 8000
+
+User request: install the node dependencies
+npm install
+
+User request: list running docker containers
+docker ps
+
+User request: stop all docker containers
+docker stop $(docker ps -q)
+
+User request: show environment variables containing PATH
+env | grep PATH
+
+User request: how long has this machine been running
+uptime
+
+User request: show memory usage
+top -l 1 | head -n 10
+
+User request: find files modified in the last day
+find . -type f -mtime -1
+
+User request: find empty directories
+find . -type d -empty
+
+User request: show the first 20 lines of data.csv
+head -n 20 data.csv
+
+User request: count the files in this folder
+ls -1 | wc -l
+
+User request: compare a.txt and b.txt
+diff a.txt b.txt
+
+User request: print the sha256 of release.zip
+shasum -a 256 release.zip
+
+User request: generate an ssh key
+ssh-keygen -t ed25519
+
+User request: show the current date in UTC
+date -u
+
+User request: open this folder in finder
+open .
+
+User request: copy the contents of id_rsa.pub to the clipboard
+pbcopy < ~/.ssh/id_rsa.pub"""
+
+PROMPT_CACHE_KEY = "nlsh-v1"
+
+# A single shell command fits comfortably; anything longer is unwanted prose
+MAX_OUTPUT_TOKENS = 64
+# Cut generation at the end of the first line or at an opening code fence.
+# Anthropic rejects whitespace-only stop sequences, so it only gets the fence.
+STOP_SEQUENCES = ["\n", "```"]
+ANTHROPIC_STOP_SEQUENCES = ["```"]
 
 # =============================================================================
 # Provider Abstraction
 # =============================================================================
 
+# One keep-alive connection pool for every SDK, so switching providers or
+# rotating a key does not cost a fresh TLS handshake
+http_client = None
+
+def shared_http():
+    global http_client
+    if http_client is None:
+        import httpx
+        http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=10)
+        )
+    return http_client
+
+class TruncatedCommandError(Exception):
+    """The model hit MAX_OUTPUT_TOKENS, so the command is incomplete."""
+
+    def __init__(self):
+        super().__init__("command was cut off at the output limit - try a shorter request")
+
+def make_gemini_client():
+    from google import genai
+    from google.genai import types
+    return genai.Client(
+        api_key=os.getenv(GeminiProvider.key_env_var),
+        http_options=types.HttpOptions(httpx_async_client=shared_http())
+    )
+
 class Provider(ABC):
     name: str
     key_env_var: str
     key_url: str
 
     @abstractmethod
-    def generate(self, prompt: str) -> str:
+    async def generate(self, system: str, prompt: str) -> str:
+        pass
+
+    @abstractmethod
+    def generate_stream(self, system: str, prompt: str) -> AsyncIterator[str]:
+        """Yield the response text as it arrives."""
         pass
 
+    def set_api_key(self, api_key: str):
+        """Switch to a new key; SDK clients that allow it only swap the auth header."""
+        self.client.api_key = api_key
+
 
 class GeminiProvider(Provider):
     name = "gemini"
     key_env_var = "GEMINI_API_KEY"
     key_url = "https://aistudio.google.com/apikey"
+    model = "gemini-2.5-flash-lite"
+    cache_ttl = 3600  # seconds
+    cache_refresh_margin = 300  # extend the cache this long before it expires
+    cache_expiry_slack = 30  # stop referencing it this close to expiry
+    # Sessions share one cache per prompt version instead of each leaving one behind
+    cache_display_name = "nlsh-" + hashlib.sha256(STATIC_PROMPT_PREFIX.encode()).hexdigest()[:12]
 
     def __init__(self):
-        from google import genai
-        self.client = genai.Client(api_key=os.getenv(self.key_env_var))
-
-    def generate(self, prompt: str) -> str:
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
+        self.client = make_gemini_client()
+        self.cache = None
+        self.cache_expires = 0.0
+        self.cache_task = None
+        self.cache_disabled = False
+
+    def set_api_key(self, api_key: str):
+        # The context cache belongs to the old key's project; drop it there and start over
+        if self.cache_task and not self.cache_task.done():
+            self.cache_task.cancel()
+        if self.cache:
+            try:
+                run_async(self.client.aio.caches.delete(name=self.cache.name))
+            except Exception:
+                pass  # the old key may no longer be valid; the cache expires on its own
+        self.__init__()
+
+    def cache_usable(self) -> bool:
+        return self.cache is not None and time.time() < self.cache_expires - self.cache_expiry_slack
+
+    def refresh_cache(self):
+        """Create or extend the context cache in the background when it is missing or
+        close to expiring. Calls made meanwhile send the instructions inline."""
+        if self.cache_disabled or (self.cache_task and not self.cache_task.done()):
+            return
+        if self.cache and time.time() < self.cache_expires - self.cache_refresh_margin:
+            return
+        self.cache_task = asyncio.ensure_future(self.create_cache())
+
+    async def find_cache(self):
+        """Find the cache an earlier session left behind, rather than paying for another."""
+        async for cache in await self.client.aio.caches.list():
+            if cache.display_name == self.cache_display_name and cache.model == f"models/{self.model}":
+                return cache
+        return None
+
+    async def create_cache(self):
+        """Upload the static instructions once so each call only sends the dynamic tail."""
+        from google.genai import types, errors
+        ttl = f"{self.cache_ttl}s"
+        try:
+            cache = self.cache or await self.find_cache()
+            if cache:
+                try:
+                    cache = await self.client.aio.caches.update(
+                        name=cache.name, config=types.UpdateCachedContentConfig(ttl=ttl)
+                    )
+                except errors.APIError:
+                    cache = None  # expired before we could extend it
+            if cache is None:
+                cache = await self.client.aio.caches.create(
+                    model=f"models/{self.model}",
+                    config=types.CreateCachedContentConfig(
+                        display_name=self.cache_display_name,
+                        system_instruction=STATIC_PROMPT_PREFIX,
+                        ttl=ttl
+                    )
+                )
+        except Exception:
+            # Below the model's minimum cache size, or caching unavailable for this key
+            self.cache = None
+            self.cache_disabled = True
+            return
+        self.cache = cache
+        if cache.expire_time:
+            self.cache_expires = cache.expire_time.timestamp()
+        else:
+            self.cache_expires = time.time() + self.cache_ttl
+
+    def content_config(self, system: str, use_cache: bool):
+        from google.genai import types
+        options = dict(
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+            max_output_tokens=MAX_OUTPUT_TOKENS,
+            stop_sequences=STOP_SEQUENCES
         )
-        return response.text.strip()
+        if use_cache:
+            return types.GenerateContentConfig(cached_content=self.cache.name, **options)
+        return types.GenerateContentConfig(system_instruction=system, **options)
+
+    async def request(self, method, system: str, prompt: str):
+        from google.genai import errors
+        self.refresh_cache()
+        use_cache = system == STATIC_PROMPT_PREFIX and self.cache_usable()
+        try:
+            return await method(model=self.model, contents=prompt, config=self.content_config(system, use_cache))
+        except errors.ClientError as e:
+            # A missing or expired cache is reported as 404, or as 403 "not found (or permission denied)"
+            if not use_cache or e.code not in (403, 404):
+                raise
+            self.cache = None
+            self.refresh_cache()
+            return await method(model=self.model, contents=prompt, config=self.content_config(system, False))
+
+    @staticmethod
+    def check_finished(response):
+        from google.genai import types
+        if response.candidates and response.candidates[0].finish_reason == types.FinishReason.MAX_TOKENS:
+            raise TruncatedCommandError()
+
+    async def generate(self, system: str, prompt: str) -> str:
+        response = await self.request(self.client.aio.models.generate_content, system, prompt)
+        self.check_finished(response)
+        return (response.text or "").strip()
+
+    async def generate_stream(self, system: str, prompt: str) -> AsyncIterator[str]:
+        stream = await self.request(self.client.aio.models.generate_content_stream, system, prompt)
+        async for chunk in stream:
+            self.check_finished(chunk)
+            if chunk.text:
+                yield chunk.text
 
 
 class OpenAIProvider(Provider):
@@ -53,16 +421,36 @@ class OpenAIProvider(Provider):
     key_url = "https://platform.openai.com/api-keys"
 
     def __init__(self):
-        from openai import OpenAI
-        self.client = OpenAI(api_key=os.getenv(self.key_env_var))
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=os.getenv(self.key_env_var), http_client=shared_http())
 
-    def generate(self, prompt: str) -> str:
-        response = self.client.chat.completions.create(
+    def request_args(self, system: str, prompt: str) -> dict:
+        return dict(
             model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=256
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=MAX_OUTPUT_TOKENS,
+            stop=STOP_SEQUENCES,
+            prompt_cache_key=PROMPT_CACHE_KEY
         )
-        return response.choices[0].message.content.strip()
+
+    async def generate(self, system: str, prompt: str) -> str:
+        response = await self.client.chat.completions.create(**self.request_args(system, prompt))
+        if response.choices[0].finish_reason == "length":
+            raise TruncatedCommandError()
+        return (response.choices[0].message.content or "").strip()
+
+    async def generate_stream(self, system: str, prompt: str) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(**self.request_args(system, prompt), stream=True)
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].finish_reason == "length":
+                raise TruncatedCommandError()
+            if chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
 
 class ClaudeProvider(Provider):
@@ -71,38 +459,61 @@ class ClaudeProvider(Provider):
     key_url = "https://console.anthropic.com/settings/keys"
 
     def __init__(self):
-        from anthropic import Anthropic
-        self.client = Anthropic(api_key=os.getenv(self.key_env_var))
+        from anthropic import AsyncAnthropic
+        self.client = AsyncAnthropic(api_key=os.getenv(self.key_env_var), http_client=shared_http())
 
-    def generate(self, prompt: str) -> str:
-        response = self.client.messages.create(
+    def request_args(self, system: str, prompt: str) -> dict:
+        return dict(
             model="claude-sonnet-4-20250514",
-            max_tokens=256,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            stop_sequences=ANTHROPIC_STOP_SEQUENCES,
+            system=[{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}],
             messages=[{"role": "user", "content": prompt}]
         )
-        return response.content[0].text.strip()
 
+    async def generate(self, system: str, prompt: str) -> str:
+        response = await self.client.messages.create(**self.request_args(system, prompt))
+        if response.stop_reason == "max_tokens":
+            raise TruncatedCommandError()
+        return "".join(block.text for block in response.content if block.type == "text").strip()
+
+    async def generate_stream(self, system: str, prompt: str) -> AsyncIterator[str]:
+        async with self.client.messages.stream(**self.request_args(system, prompt)) as stream:
+            async for text in stream.text_stream:
+                yield text
+            message = await stream.get_final_message()
+            if message.stop_reason == "max_tokens":
+                raise TruncatedCommandError()
 
-class OpenRouterProvider(Provider):
+
+class OpenRouterProvider(OpenAIProvider):
     """OpenRouter - unified API. Access Claude, GPT, and 200+ models."""
     name = "openrouter"
     key_env_var = "OPENROUTER_API_KEY"
     key_url = "https://openrouter.ai/keys"
 
     def __init__(self):
-        from openai import OpenAI
-        self.client = OpenAI(
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(
             base_url="https://openrouter.ai/api/v1",
-            api_key=os.getenv(self.key_env_var)
+            api_key=os.getenv(self.key_env_var),
+            http_client=shared_http()
         )
 
-    def generate(self, prompt: str) -> str:
-        response = self.client.chat.completions.create(
+    def request_args(self, system: str, prompt: str) -> dict:
+        # cache_control is honored for Anthropic models, prompt_cache_key for OpenAI ones
+        return dict(
             model="anthropic/claude-sonnet-4",  # Can also use openai/gpt-4o-mini, etc.
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=256
+            messages=[
+                {"role": "system", "content": [
+                    {"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}
+                ]},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=MAX_OUTPUT_TOKENS,
+            stop=ANTHROPIC_STOP_SEQUENCES,  # default model is Anthropic
+            prompt_cache_key=PROMPT_CACHE_KEY
         )
-        return response.choices[0].message.content.strip()
 
 PROVIDERS = {
     "gemini": GeminiProvider,
@@ -115,29 +526,32 @@ PROVIDERS = {
 # Configuration
 # =============================================================================
 
+ENV_LINE = re.compile(rb"^[ \t]*([^#=\s][^=\r\n]*)=([^\r\n]*)", re.MULTILINE)
+
+def read_env() -> dict:
+    if not os.path.exists(env_path) or not os.path.getsize(env_path):
+        return {}
+    with open(env_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return {k.strip().decode(): v.strip().decode() for k, v in ENV_LINE.findall(mm)}
+
 def load_env():
-    if os.path.exists(env_path):
-        with open(env_path) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#") and "=" in line:
-                    key, value = line.split("=", 1)
-                    os.environ[key] = value
+    os.environ.update(read_env())
 
 def save_env_key(key_name: str, value: str):
     """Save or update a key in the .env file."""
-    env_vars = {}
-    if os.path.exists(env_path):
-        with open(env_path) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#") and "=" in line:
-                    k, v = line.split("=", 1)
-                    env_vars[k] = v
+    env_vars = read_env()
     env_vars[key_name] = value
-    with open(env_path, "w") as f:
-        for k, v in env_vars.items():
-            f.write(f"{k}={v}\n")
+    data = "".join(f"{k}={v}\n" for k, v in env_vars.items()).encode()
+    # Write a private temp file and swap it in, so .env ends up 0600 even if it
+    # already existed and is never left half-written
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(env_path), prefix=".env.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, env_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
     os.environ[key_name] = value
 
 def get_current_provider_name() -> str:
@@ -181,6 +595,36 @@ def show_providers():
 # Provider Initialization
 # =============================================================================
 
+class LazyProvider(Provider):
+    """Stands in for a provider until its first request, so the SDK import
+    and client setup are skipped entirely in sessions that only run shell commands."""
+
+    def __init__(self, provider_class):
+        self.provider_class = provider_class
+        self.name = provider_class.name
+        self.key_env_var = provider_class.key_env_var
+        self.key_url = provider_class.key_url
+        self.provider = None
+
+    def resolve(self) -> Provider:
+        if self.provider is None:
+            try:
+                self.provider = self.provider_class()
+            except Exception as e:
+                raise RuntimeError(f"failed to initialize {self.name}: {e}") from e
+        return self.provider
+
+    async def generate(self, system: str, prompt: str) -> str:
+        return await self.resolve().generate(system, prompt)
+
+    def generate_stream(self, system: str, prompt: str) -> AsyncIterator[str]:
+        return self.resolve().generate_stream(system, prompt)
+
+    def set_api_key(self, api_key: str):
+        # Not built yet means the new key is simply picked up from the environment
+        if self.provider:
+            self.provider.set_api_key(api_key)
+
 def init_provider(name: str) -> Provider:
     if name not in PROVIDERS:
         print(f"\033[31mUnknown provider: {name}\033[0m")
@@ -193,83 +637,569 @@ def init_provider(name: str) -> Provider:
         if not setup_api_key(provider_class):
             sys.exit(1)
 
+    return LazyProvider(provider_class)
+
+# =============================================================================
+# Event Loop
+# =============================================================================
+
+# One loop for the whole session so async clients keep their connection pools
+event_loop = asyncio.new_event_loop()
+asyncio.set_event_loop(event_loop)
+
+# Upper bound on concurrent outbound requests (model calls, embeddings)
+PIPELINE_CONCURRENCY = 4
+request_slots = asyncio.Semaphore(PIPELINE_CONCURRENCY)
+
+def run_async(coro):
+    """Run coro to completion on the shared loop; Ctrl-C cancels it."""
+    task = event_loop.create_task(coro)
+    # The selector swallows InterruptedError, so route SIGINT through the loop
+    event_loop.add_signal_handler(signal.SIGINT, task.cancel)
     try:
-        return provider_class()
-    except Exception as e:
-        print(f"\033[31mFailed to initialize {name}: {e}\033[0m")
-        sys.exit(1)
+        return event_loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        print()
+        raise InterruptedError()
+    finally:
+        event_loop.remove_signal_handler(signal.SIGINT)
+        signal.signal(signal.SIGINT, exit_handler)
 
 # =============================================================================
 # Command History
 # =============================================================================
 
-command_history = []
 MAX_HISTORY = 10
 MAX_CONTEXT_CHARS = 4000
 
+# Parallel columns, oldest first; total_size tracks sum(sizes)
+commands = deque(maxlen=MAX_HISTORY)
+outputs = deque(maxlen=MAX_HISTORY)
+sizes = deque(maxlen=MAX_HISTORY)
+total_size = 0
+# Rendered prompt context, rebuilt only after the history changes
+formatted_history = None
+
 def get_context_size() -> int:
-    return sum(len(e["command"]) + len(e["output"]) for e in command_history)
-
-def add_to_history(command: str, output: str = ""):
-    command_history.append({
-        "command": command,
-        "output": output[:500] if output else ""
-    })
-    while len(command_history) > MAX_HISTORY:
-        command_history.pop(0)
-    while get_context_size() > MAX_CONTEXT_CHARS and len(command_history) > 1:
-        command_history.pop(0)
+    return total_size
+
+def pop_oldest():
+    global total_size
+    commands.popleft()
+    outputs.popleft()
+    total_size -= sizes.popleft()
+
+def add_to_history(command: str, output: str = "", persist: bool = True):
+    global total_size, formatted_history
+    formatted_history = None
+    output = output[:500] if output else ""
+    if len(sizes) == MAX_HISTORY:
+        pop_oldest()
+    commands.append(command)
+    outputs.append(output)
+    sizes.append(len(command) + len(output))
+    total_size += sizes[-1]
+    while get_context_size() > MAX_CONTEXT_CHARS and len(sizes) > 1:
+        pop_oldest()
+    if persist and history_file:
+        history_file.write(json.dumps({"command": command, "output": output}).encode() + b"\n")
 
 def format_history() -> str:
-    if not command_history:
+    global formatted_history
+    if formatted_history is not None:
+        return formatted_history
+    if not commands:
         return "No previous commands."
 
     lines = []
-    for i, entry in enumerate(command_history[-5:], 1):
-        lines.append(f"{i}. $ {entry['command']}")
-        if entry['output']:
-            output_lines = entry['output'].strip().split('\n')[:2]
+    start = max(0, len(commands) - 5)
+    recent = zip(islice(commands, start, None), islice(outputs, start, None))
+    for i, (command, output) in enumerate(recent, 1):
+        lines.append(f"{i}. $ {command}")
+        if output:
+            output_lines = output.strip().split('\n')[:2]
             for line in output_lines:
                 lines.append(f"   {line}")
-    return "\n".join(lines)
+    formatted_history = "\n".join(lines)
+    return formatted_history
+
+# Append-only log of history entries, so context survives restarts
+history_file = None
+HISTORY_BUFFER_SIZE = 64 * 1024
+HISTORY_TAIL_BYTES = 64 * 1024
+HISTORY_MAX_BYTES = 1024 * 1024
+
+def load_history():
+    """Restore the most recent entries from disk and open the log for appending.
+
+    If the file can't be read or opened, history is kept in memory only."""
+    global history_file
+    try:
+        size = os.path.getsize(history_path) if os.path.exists(history_path) else 0
+        if size:
+            with open(history_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = max(0, size - HISTORY_TAIL_BYTES)
+                lines = mm[start:].split(b"\n")
+            if start:
+                lines = lines[1:]  # first line is likely cut in half
+            for line in [l for l in lines if l][-MAX_HISTORY:]:
+                try:
+                    entry = json.loads(line)
+                    command, output = entry["command"], entry["output"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if isinstance(command, str) and isinstance(output, str):
+                    add_to_history(command, output, persist=False)
+        if size > HISTORY_MAX_BYTES:
+            # Compact down to what was just restored
+            with open(history_path, "wb") as f:
+                f.write(b"".join(json.dumps({"command": c, "output": o}).encode() + b"\n"
+                                 for c, o in zip(commands, outputs)))
+        # Captured output can include secrets, so keep the log private like .env
+        fd = os.open(history_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        os.fchmod(fd, 0o600)
+        history_file = os.fdopen(fd, "ab", buffering=HISTORY_BUFFER_SIZE)
+    except OSError:
+        history_file = None
+        return
+    atexit.register(flush_history)
+
+def flush_history():
+    if history_file:
+        history_file.flush()
+
+# =============================================================================
+# Response Cache
+# =============================================================================
+
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_CACHE_TTL = 600  # seconds
+
+# Requests that point back at live history must always reach the model
+HISTORY_REFERENCE = re.compile(r"\b(that|it|again|previous|same|them)\b", re.IGNORECASE)
+
+class ResponseCache:
+    """LFU cache of translated commands with a per-entry TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = {}  # key -> [command, timestamp, hits]
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self.ttl:
+            del self.entries[key]
+            return None
+        entry[2] += 1
+        return entry[0]
+
+    def put(self, key, command: str):
+        if key not in self.entries and len(self.entries) >= self.maxsize:
+            # Least frequently used goes first, oldest breaks ties
+            victim = min(self.entries, key=lambda k: (self.entries[k][2], self.entries[k][1]))
+            del self.entries[victim]
+        self.entries[key] = [command, time.monotonic(), 0]
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+# =============================================================================
+# Semantic Cache
+# =============================================================================
+
+SEMANTIC_CACHE_SIZE = 1024
+SEMANTIC_THRESHOLD = 0.92
+SEMANTIC_CACHE_TTL = RESPONSE_CACHE_TTL
+
+# Words that may differ between two requests without changing the command
+STOPWORDS = frozenset([
+    "a", "an", "the", "me", "my", "please", "can", "could", "you", "i", "want",
+    "to", "would", "like", "show", "list", "display", "print", "of",
+    "in", "here", "this", "current", "folder", "directory", "dir", "just", "now"
+])
+WORD = re.compile(r"\w+")
+
+def request_words(text: str) -> set:
+    return set(WORD.findall(text.lower()))
+
+class SemanticCache:
+    """Matches near-duplicate requests ("show disk usage" / "show me disk usage")
+    to earlier commands by cosine similarity of Gemini embeddings.
+
+    A hit must come from the same directory, be younger than the TTL, and
+    differ from the new request only by stopwords, so "last 5 commits" never
+    returns the command for "last 10 commits"."""
+    model = "gemini-embedding-001"
+    dimensions = 768
+
+    def __init__(self, path: str, maxsize: int, threshold: float, ttl: float):
+        self.path = path
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self.connect()
+        self.clear()
+        self.disabled = False
+        self.dirty = False
+        self.load()
+
+    def connect(self):
+        self.api_key = os.getenv(GeminiProvider.key_env_var)
+        self.client = make_gemini_client()
+
+    def clear(self, dimensions: int = 0):
+        import numpy as np
+        self.embeddings = np.empty((0, dimensions), dtype=np.float32)  # unit rows, N x D
+        self.prompts = []
+        self.commands = []
+        self.cwds = []
+        self.times = np.empty(0, dtype=np.float64)
+        self.hits = np.empty(0, dtype=np.int64)
+
+    def load(self):
+        import numpy as np
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                if str(data["model"]) != self.model:
+                    return
+                self.embeddings = data["embeddings"].astype(np.float32)
+                self.prompts = data["prompts"].tolist()
+                self.commands = data["commands"].tolist()
+                self.cwds = data["cwds"].tolist()
+                self.times = data["times"].astype(np.float64)
+                self.hits = data["hits"].astype(np.int64)
+        except Exception:
+            # Unreadable or outdated cache file; start over rather than fail the session
+            self.clear()
+
+    def save(self):
+        import numpy as np
+        # The install dir is gone after !uninstall
+        if not self.dirty or not os.path.isdir(os.path.dirname(self.path)):
+            return
+        # Requests and commands can hold tokens or private paths; keep it owner-only
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                model=np.array(self.model),
+                embeddings=self.embeddings,
+                prompts=np.array(self.prompts, dtype=str),
+                commands=np.array(self.commands, dtype=str),
+                cwds=np.array(self.cwds, dtype=str),
+                times=self.times,
+                hits=self.hits
+            )
+        self.dirty = False
+
+    async def embed(self, text: str):
+        import numpy as np
+        from google.genai import types
+        result = await self.client.aio.models.embed_content(
+            model=self.model,
+            contents=text,
+            config=types.EmbedContentConfig(output_dimensionality=self.dimensions)
+        )
+        vector = np.asarray(result.embeddings[0].values, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def eligible(self, prompt: str, cwd: str):
+        """Mask of entries prompt could reuse, before comparing embeddings."""
+        import numpy as np
+        words = request_words(prompt)
+        now = time.time()
+        return np.array([
+            c == cwd and now - t <= self.ttl and words ^ request_words(p) <= STOPWORDS
+            for p, c, t in zip(self.prompts, self.cwds, self.times)
+        ], dtype=bool)
+
+    def has_candidate(self, prompt: str, cwd: str) -> bool:
+        return bool(self.eligible(prompt, cwd).any())
+
+    def lookup(self, query, prompt: str, cwd: str):
+        import numpy as np
+        mask = self.eligible(prompt, cwd)
+        if not mask.any():
+            return None
+        scores = np.where(mask, self.embeddings @ query, -1)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        self.hits[best] += 1
+        self.dirty = True
+        return self.commands[best]
+
+    def add(self, query, prompt: str, cwd: str, command: str):
+        import numpy as np
+        if self.embeddings.shape[1] != query.shape[0]:
+            # Embedding size changed (or first entry); old rows are not comparable
+            self.clear(query.shape[0])
+        # Expired entries go first, then the least frequently used
+        expired = np.flatnonzero(time.time() - self.times > self.ttl)
+        if len(self.commands) >= self.maxsize and not len(expired):
+            expired = [int(np.argmin(self.hits))]
+        for victim in sorted(expired, reverse=True):
+            del self.prompts[victim]
+            del self.commands[victim]
+            del self.cwds[victim]
+        self.embeddings = np.delete(self.embeddings, expired, axis=0)
+        self.times = np.delete(self.times, expired)
+        self.hits = np.delete(self.hits, expired)
+        self.embeddings = np.vstack([self.embeddings, query[np.newaxis, :]])
+        self.times = np.append(self.times, time.time())
+        self.hits = np.append(self.hits, 0)
+        self.prompts.append(prompt)
+        self.commands.append(command)
+        self.cwds.append(cwd)
+        self.dirty = True
+        self.save()
+
+semantic_cache = None
+
+def store_embedding(semantic: SemanticCache, prompt: str, cwd: str, command: str):
+    """Done-callback that adds a finished embedding task's vector to the cache."""
+    def store(task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            semantic.disabled = True
+            return
+        semantic.add(task.result(), prompt, cwd, command)
+    return store
+
+def get_semantic_cache(provider: Provider):
+    """Return the shared SemanticCache, or None if embeddings are unavailable.
+
+    Requests are only embedded when the user picked Gemini, so they are never
+    sent to a provider other than the active one."""
+    global semantic_cache
+    if provider.name != GeminiProvider.name or not os.getenv(GeminiProvider.key_env_var):
+        return None
+    if semantic_cache is None:
+        try:
+            semantic_cache = SemanticCache(semcache_path, SEMANTIC_CACHE_SIZE,
+                                           SEMANTIC_THRESHOLD, SEMANTIC_CACHE_TTL)
+        except ImportError:
+            return None
+    elif semantic_cache.api_key != os.getenv(GeminiProvider.key_env_var):
+        semantic_cache.connect()
+        semantic_cache.disabled = False
+    return None if semantic_cache.disabled else semantic_cache
 
 # =============================================================================
 # Command Generation
 # =============================================================================
 
-def get_command(provider: Provider, user_input: str, cwd: str) -> str:
+async def stream_command(provider: Provider, prompt: str,
+                         on_token: Optional[Callable[[str], None]]) -> str:
+    if on_token is None:
+        return await provider.generate(STATIC_PROMPT_PREFIX, prompt)
+    parts = []
+    pending = ""  # whitespace held back until more text follows it
+    async for token in provider.generate_stream(STATIC_PROMPT_PREFIX, prompt):
+        text = pending + token
+        if not parts:
+            text = text.lstrip()
+        body = text.rstrip()
+        pending = text[len(body):]
+        if body:
+            parts.append(body)
+            on_token(body)
+    return "".join(parts)
+
+async def bounded(coro):
+    async with request_slots:
+        return await coro
+
+async def get_command(provider: Provider, user_input: str, cwd: str,
+                      on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Translate user_input into a shell command, passing text to on_token as it arrives."""
+    emit = on_token or (lambda token: None)
     history_context = format_history()
-    prompt = f"""You are a shell command translator. Convert the user's request into a shell command for macOS/zsh.
-Current directory: {cwd}
+    cache_key = (provider.name, cwd, history_context, user_input)
+    cacheable = not HISTORY_REFERENCE.search(user_input)
+    if cacheable:
+        command = response_cache.get(cache_key)
+        if command is not None:
+            emit(command)
+            return command
+
+    prompt = f"""Current directory: {cwd}
 
 Recent command history:
 {history_context}
 
-Rules:
-- Output ONLY the command, nothing else
-- No explanations, no markdown, no backticks
-- If unclear, make a reasonable assumption
-- Prefer simple, common commands
-- Use the command history for context (e.g., "do that again", "delete the file I just created")
-
 User request: {user_input}"""
 
-    return provider.generate(prompt)
-
+    # The embedding call runs alongside the model call. Model output is held
+    # back only when a cached entry could match (checked locally first);
+    # otherwise it streams straight through and the embedding is stored
+    # for future hits whenever it arrives
+    semantic = get_semantic_cache(provider) if cacheable else None
+    could_hit = semantic is not None and semantic.has_candidate(user_input, cwd)
+    held = []
+    released = not could_hit
+
+    def relay(token: str):
+        if released:
+            emit(token)
+        else:
+            held.append(token)
+
+    embed_task = asyncio.ensure_future(bounded(semantic.embed(user_input))) if semantic else None
+    llm_task = asyncio.ensure_future(bounded(stream_command(provider, prompt, relay if on_token else None)))
+    keep_embedding = False
+    try:
+        if could_hit:
+            try:
+                command = semantic.lookup(await embed_task, user_input, cwd)
+            except Exception:
+                # Don't hold back every later request behind a failing embedding call
+                semantic.disabled = True
+                command = None
+            if command is not None:
+                response_cache.put(cache_key, command)
+                emit(command)
+                return command
+            released = True
+            for token in held:
+                emit(token)
+
+        command = await llm_task
+        if cacheable and command:
+            response_cache.put(cache_key, command)
+            if embed_task:
+                embed_task.add_done_callback(store_embedding(semantic, user_input, cwd, command))
+                keep_embedding = True
+    finally:
+        # Cancel whatever is still running and reap it, so a failure we no longer
+        # need is not reported later and the stream closes right away
+        tasks = [llm_task] if keep_embedding or not embed_task else [embed_task, llm_task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return command
+
+SHELL_COMMANDS = frozenset(["ls", "pwd", "clear", "exit", "quit", "whoami", "date", "cal",
+                            "top", "htop", "history", "which", "man", "touch", "head", "tail",
+                            "grep", "find", "sort", "wc", "diff", "tar", "zip", "unzip"])
+SHELL_STARTERS = ("cd ", "ls ", "echo ", "cat ", "mkdir ", "rm ", "cp ", "mv ",
+                  "git ", "npm ", "node ", "npx ", "python", "pip ", "brew ", "curl ",
+                  "wget ", "chmod ", "chown ", "sudo ", "vi ", "vim ", "nano ", "code ",
+                  "open ", "export ", "source ", "docker ", "kubectl ", "aws ", "gcloud ",
+                  "./", "/", "~", "$", ">", ">>", "|", "&&")
+# The prefix set is fixed, so compile it once into a single alternation
+SHELL_PREFIX_RE = re.compile("|".join(re.escape(s) for s in SHELL_STARTERS))
+
+@functools.lru_cache(maxsize=512)
 def is_natural_language(text: str) -> bool:
     if text.startswith("!"):
         return False
-    shell_commands = ["ls", "pwd", "clear", "exit", "quit", "whoami", "date", "cal",
-                      "top", "htop", "history", "which", "man", "touch", "head", "tail",
-                      "grep", "find", "sort", "wc", "diff", "tar", "zip", "unzip"]
-    shell_starters = ["cd ", "ls ", "echo ", "cat ", "mkdir ", "rm ", "cp ", "mv ",
-                      "git ", "npm ", "node ", "npx ", "python", "pip ", "brew ", "curl ",
-                      "wget ", "chmod ", "chown ", "sudo ", "vi ", "vim ", "nano ", "code ",
-                      "open ", "export ", "source ", "docker ", "kubectl ", "aws ", "gcloud ",
-                      "./", "/", "~", "$", ">", ">>", "|", "&&"]
-    if text in shell_commands:
+    if text in SHELL_COMMANDS:
         return False
-    return not any(text.startswith(s) for s in shell_starters)
+    return SHELL_PREFIX_RE.match(text) is None
+
+# =============================================================================
+# Command Execution
+# =============================================================================
+
+READ_CHUNK = 64 * 1024
+TERMINATE_TIMEOUT = 1.0  # seconds between SIGTERM and SIGKILL
+HISTORY_OUTPUT_BYTES = 500
+
+# Terminal control sequences: CSI (colors, cursor moves), OSC (titles, links), and two-byte escapes
+ANSI_ESCAPE = re.compile(r"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
+
+def command_env() -> dict:
+    # Built per command so keys loaded from .env reach the child. Output goes
+    # to a pseudo-terminal, so keep pagers from taking over the screen.
+    return dict(os.environ, PAGER="cat", GIT_PAGER="cat")
+
+def clean_output(text: str) -> str:
+    """Reduce terminal output to the plain text a pipe would have captured."""
+    text = ANSI_ESCAPE.sub("", text).replace("\r\n", "\n")
+    # A bare carriage return redraws the line (progress bars); keep the final state
+    return "\n".join(line.rsplit("\r", 1)[-1] for line in text.split("\n"))
+
+class RunningCommand:
+    """A shell command writing to a pseudo-terminal that we relay to stdout."""
+
+    def __init__(self, command: str, speculative: bool = False):
+        self.fd, slave = pty.openpty()
+        try:
+            if sys.stdout.isatty():
+                size = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, b"\0" * 8)
+                fcntl.ioctl(slave, termios.TIOCSWINSZ, size)
+            self.process = subprocess.Popen(
+                command, shell=True, env=command_env(),
+                stdin=subprocess.DEVNULL if speculative else None,
+                stdout=slave, stderr=slave
+            )
+        except BaseException:
+            os.close(self.fd)
+            raise
+        finally:
+            os.close(slave)
+
+    def stream(self) -> str:
+        """Relay output until the command exits; returns the tail for history."""
+        tail = deque(maxlen=HISTORY_OUTPUT_BYTES)
+        out = sys.stdout.buffer
+        sys.stdout.flush()
+        try:
+            while True:
+                try:
+                    chunk = os.read(self.fd, READ_CHUNK)
+                except OSError:  # EIO on Linux once the command closes its end
+                    break
+                if not chunk:
+                    break
+                out.write(chunk)
+                out.flush()
+                tail.extend(chunk)
+            self.process.wait()
+        finally:
+            self.close()
+        return clean_output(bytes(tail).decode(errors="replace"))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.process.poll() is None:
+            # Give the command a chance to clean up (lock files, temp files) first
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=TERMINATE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+def run_command(command: str) -> str:
+    return RunningCommand(command).stream()
+
+# =============================================================================
+# Speculative Execution
+# =============================================================================
+
+# Read-only commands that may start while the user is still reading the prompt
+SPECULATIVE_COMMAND = re.compile(r"^(?:ls|cat|find|grep|pwd|wc|head|du|df)(?:\s|$)")
+# Anything that could write, escalate, chain into another command, or read a
+# device such as /dev/tty that would steal the keystrokes meant for [Enter]
+UNSAFE_COMMAND = re.compile(r"rm|mv|sudo|chmod|[<>;&|`$()\n\r]|-exec|-ok|-delete|-fprint|-fls|--output|--ext-diff|-c\b|/dev/")
+
+def speculate(command: str):
+    """Start a safe read-only command before confirmation; returns it or None."""
+    if len(command.splitlines()) != 1:
+        return None
+    if not SPECULATIVE_COMMAND.match(command) or UNSAFE_COMMAND.search(command):
+        return None
+    return RunningCommand(command, speculative=True)
 
 # =============================================================================
 # Main Loop
@@ -282,6 +1212,7 @@ def main():
         sys.exit(1)
 
     load_env()
+    load_history()
 
     provider_name = get_current_provider_name()
     provider = init_provider(provider_name)
@@ -293,6 +1224,7 @@ def main():
 
     while True:
         try:
+            flush_history()
             cwd = os.getcwd()
             prompt = f"\033[32m{os.path.basename(cwd)}\033[0m > "
             user_input = input(prompt).strip()
@@ -314,8 +1246,8 @@ def main():
 
             # !api - change API key
             if user_input == "!api":
-                setup_api_key(PROVIDERS[provider_name])
-                provider = init_provider(provider_name)
+                if setup_api_key(PROVIDERS[provider_name]):
+                    provider.set_api_key(os.getenv(provider.key_env_var))
                 continue
 
             # !provider - switch providers
@@ -356,39 +1288,46 @@ def main():
                 cmd = user_input[1:]
                 if not cmd:
                     continue
-                result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-                print(result.stdout, end="")
-                if result.stderr:
-                    print(result.stderr, end="")
-                add_to_history(cmd, result.stdout + result.stderr)
+                add_to_history(cmd, run_command(cmd))
                 continue
 
             # Regular shell commands
             if not is_natural_language(user_input):
-                result = subprocess.run(user_input, shell=True, capture_output=True, text=True)
-                print(result.stdout, end="")
-                if result.stderr:
-                    print(result.stderr, end="")
-                add_to_history(user_input, result.stdout + result.stderr)
+                add_to_history(user_input, run_command(user_input))
                 continue
 
             # Natural language -> command
-            command = get_command(provider, user_input, cwd)
-            confirm = input(f"\033[33m→ {command}\033[0m [Enter] ")
-
-            if confirm == "":
-                if command.startswith("cd "):
-                    path = os.path.expanduser(command[3:].strip())
-                    try:
-                        os.chdir(path)
-                    except Exception as e:
-                        print(f"cd: {e}")
-                else:
-                    result = subprocess.run(command, shell=True, capture_output=True, text=True)
-                    print(result.stdout, end="")
-                    if result.stderr:
-                        print(result.stderr, end="")
-                    add_to_history(command, result.stdout + result.stderr)
+            print("\033[33m→ ", end="", flush=True)
+            try:
+                command = run_async(get_command(
+                    provider, user_input, cwd,
+                    on_token=lambda token: print(token, end="", flush=True)
+                ))
+            except Exception:
+                print()
+                raise
+            finally:
+                print("\033[0m", end="", flush=True)
+            if not command:
+                print("\033[31mno command generated - try rephrasing\033[0m")
+                continue
+            speculative = speculate(command)
+            try:
+                confirm = input(" [Enter] ")
+
+                if confirm == "":
+                    if command.startswith("cd "):
+                        path = os.path.expanduser(command[3:].strip())
+                        try:
+                            os.chdir(path)
+                        except Exception as e:
+                            print(f"cd: {e}")
+                    else:
+                        running = speculative or RunningCommand(command)
+                        add_to_history(command, running.stream())
+            finally:
+                if speculative:
+                    speculative.close()
 
         except (EOFError, InterruptedError, KeyboardInterrupt):
             continue
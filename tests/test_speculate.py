@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nlsh
+
+
+@pytest.mark.parametrize("command", [
+    "ls",
+    "ls -la",
+    "cat README.md",
+    "find . -name '*.py'",
+    "grep -rn TODO .",
+    "head -n 5 notes.txt",
+    "du -sh .",
+    "df -h",
+    "pwd",
+])
+def test_read_only_commands_are_speculated(command):
+    assert nlsh.SPECULATIVE_COMMAND.match(command)
+    assert not nlsh.UNSAFE_COMMAND.search(command)
+
+
+@pytest.mark.parametrize("command", [
+    # Only the first line would have been checked
+    "ls\ntouch /tmp/pwned",
+    "ls\rtouch /tmp/pwned",
+    "ls touch /tmp/pwned",
+    # Chaining, substitution and redirection
+    "ls; rm -rf x",
+    "ls && touch x",
+    "ls | sh",
+    "cat a > b",
+    "ls $(touch x)",
+    "ls `touch x`",
+    "ls (touch x)",
+    # find actions that write or run programs
+    "find . -delete",
+    "find . -exec rm {} +",
+    "find . -ok rm {} ;",
+    "find . -fprint out.txt",
+    # git can take locks or run repo-configured hooks and drivers
+    "git status",
+    "git log --oneline",
+    # Devices would steal the keystrokes meant for the [Enter] prompt
+    "cat /dev/tty",
+    "head /dev/stdin",
+    # Not on the whitelist at all
+    "lsof -i :3000",
+    "touch x",
+])
+def test_unsafe_commands_are_not_speculated(command):
+    assert nlsh.speculate(command) is None
+
+
+def test_declined_speculation_is_terminated_gracefully(tmp_path):
+    marker = tmp_path / "terminated"
+    script = f"trap 'touch {marker}; exit 0' TERM; while :; do sleep 0.05; done"
+    running = nlsh.RunningCommand(script, speculative=True)
+    time.sleep(0.2)  # let the shell install its trap
+    running.close()
+    assert running.process.returncode == 0
+    assert marker.exists()